@@ -7,6 +7,7 @@ Supports callback-based button press handling.
 
 import threading
 import logging
+import queue
 from typing import Callable, Dict, Optional
 
 try:
@@ -30,23 +31,48 @@ class ButtonManager:
     BUTTONS = [5, 6, 16, 24]
     LABELS = ["A", "B", "C", "D"]
 
-    def __init__(self, enabled: bool = True):
+    # Maximum number of button presses waiting to be dispatched to handlers
+    QUEUE_SIZE = 64
+
+    def __init__(self, enabled: bool = True, debounce_ms: int = 20):
         """
         Initialize the button manager.
 
         Args:
             enabled: Whether to enable button reading. Disable for testing/dev environments.
+            debounce_ms: Edge events on a line closer together than this are treated
+                         as contact bounce and ignored. Set to 0 to disable.
         """
         self.enabled = enabled and GPIOD_AVAILABLE
+        self.debounce_ns = debounce_ms * 1_000_000
         self.thread = None
-        self.running = False
+        self.dispatch_thread = None
         self.lock = threading.Lock()
 
-        # Callback handlers for each button
-        self.handlers: Dict[str, list[Callable]] = {label: [] for label in self.LABELS}
+        # Set while the manager is stopped, waking the background threads on stop()
+        self.stop_event = threading.Event()
+        self.stop_event.set()
+
+        # Callback handlers for each button. The tuples are replaced rather than
+        # mutated, so the event thread can read them without taking the lock.
+        self.handlers: Dict[str, tuple[Callable, ...]] = {
+            label: () for label in self.LABELS
+        }
 
         self.request = None
         self.offsets = None
+        self.offset_to_label: Dict[int, str] = {}
+        self.offset_to_gpio: Dict[int, int] = {}
+        self.last_event_ns: Dict[int, int] = {}
+
+        # Button presses are handed from the GPIO reader thread to the dispatch
+        # thread, so slow handlers never delay reading edge events
+        self.event_queue: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+
+    @property
+    def running(self) -> bool:
+        """Whether the button manager is listening for button presses."""
+        return not self.stop_event.is_set()
 
     def register_handler(self, button: str, callback: Callable) -> None:
         """
@@ -61,14 +87,16 @@ class ButtonManager:
             raise ValueError(f"Invalid button: {button}. Must be one of {self.LABELS}")
 
         with self.lock:
-            self.handlers[button].append(callback)
+            self.handlers[button] = self.handlers[button] + (callback,)
             logger.info(f"Registered handler for button {button}")
 
     def unregister_handler(self, button: str, callback: Callable) -> None:
         """Unregister a callback handler."""
         if button in self.handlers and callback in self.handlers[button]:
             with self.lock:
-                self.handlers[button].remove(callback)
+                handlers = list(self.handlers[button])
+                handlers.remove(callback)
+                self.handlers[button] = tuple(handlers)
                 logger.info(f"Unregistered handler for button {button}")
 
     def start(self) -> bool:
@@ -90,9 +118,13 @@ class ButtonManager:
 
         try:
             self._initialize_gpio()
-            self.running = True
+            self.stop_event.clear()
             self.thread = threading.Thread(target=self._run, daemon=True)
+            self.dispatch_thread = threading.Thread(
+                target=self._dispatch_loop, daemon=True
+            )
             self.thread.start()
+            self.dispatch_thread.start()
             logger.info("Button manager started")
             return True
         except Exception as e:
@@ -102,13 +134,22 @@ class ButtonManager:
 
     def stop(self) -> None:
         """Stop listening for button presses."""
-        with self.lock:
-            self.running = False
+        self.stop_event.set()
 
         if self.thread:
             self.thread.join(timeout=2)
             logger.info("Button manager stopped")
 
+        if self.dispatch_thread:
+            self.dispatch_thread.join(timeout=2)
+
+        # Discard presses that were not dispatched so they don't fire after a restart
+        while True:
+            try:
+                self.event_queue.get_nowait()
+            except queue.Empty:
+                break
+
         self._cleanup_gpio()
 
     def _initialize_gpio(self) -> None:
@@ -125,6 +166,8 @@ class ButtonManager:
 
         # Get line offsets for our buttons
         self.offsets = [chip.line_offset_from_id(btn) for btn in self.BUTTONS]
+        self.offset_to_label = dict(zip(self.offsets, self.LABELS))
+        self.offset_to_gpio = dict(zip(self.offsets, self.BUTTONS))
 
         # Build config for each pin
         line_config = dict.fromkeys(self.offsets, input_settings)
@@ -145,7 +188,7 @@ class ButtonManager:
     def _run(self) -> None:
         """Background thread that listens for button events."""
         try:
-            while self.running:
+            while not self.stop_event.is_set():
                 if not self.request:
                     break
 
@@ -159,39 +202,62 @@ class ButtonManager:
                             continue
                     events = self.request.read_edge_events()
 
-                for event in events:
-                    if not self.running:
-                        break
-
+                for event in self._debounce(events):
                     self._handle_button_event(event)
 
         except Exception as e:
             logger.error(f"Error in button monitoring thread: {e}")
-            self.running = False
+            self.stop_event.set()
         finally:
             self._cleanup_gpio()
 
+    def _debounce(self, events) -> list:
+        """Drop events that follow the previous event on the same line too closely."""
+        accepted = []
+        for event in events:
+            last_ns = self.last_event_ns.get(event.line_offset)
+            self.last_event_ns[event.line_offset] = event.timestamp_ns
+            if last_ns is not None and event.timestamp_ns - last_ns < self.debounce_ns:
+                continue
+            accepted.append(event)
+        return accepted
+
     def _handle_button_event(self, event) -> None:
         """Handle a GPIO button event."""
         try:
-            if self.offsets is None:
+            label = self.offset_to_label.get(event.line_offset)
+            if label is None:
                 return
-
-            index = self.offsets.index(event.line_offset)
-            gpio_number = self.BUTTONS[index]
-            label = self.LABELS[index]
+            gpio_number = self.offset_to_gpio[event.line_offset]
 
             logger.info(f"Button press detected: GPIO #{gpio_number} (Button {label})")
 
-            # Call all registered handlers for this button
-            with self.lock:
-                handlers = self.handlers[label].copy()
+            try:
+                self.event_queue.put_nowait(label)
+            except queue.Full:
+                # Drop the oldest press so the most recent input is kept
+                try:
+                    dropped = self.event_queue.get_nowait()
+                    logger.warning(f"Button queue full, dropped press of {dropped}")
+                except queue.Empty:
+                    pass
+                self.event_queue.put_nowait(label)
+
+        except Exception as e:
+            logger.error(f"Error handling button event: {e}")
 
-            for handler in handlers:
+    def _dispatch_loop(self) -> None:
+        """Background thread that calls the registered handlers for queued presses."""
+        while not self.stop_event.is_set():
+            # Wait with a timeout to allow graceful shutdown
+            try:
+                label = self.event_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            # Call all registered handlers for this button
+            for handler in self.handlers[label]:
                 try:
                     handler(label)
                 except Exception as e:
                     logger.error(f"Error calling button handler for {label}: {e}")
-
-        except Exception as e:
-            logger.error(f"Error handling button event: {e}")
@@ -6,12 +6,52 @@ import logging
 import subprocess
 import tempfile
 import zipfile
+import shutil
+import json
 import os
 import csv
+import sqlite3
+from contextlib import closing
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+GTFS_URL = "https://www.ztm.poznan.pl/pl/dla-deweloperow/getGTFSFile"
+
+# GTFS files read by the plugin, the rest of the archive is not extracted
+GTFS_FILES = (
+    "feed_info.txt",
+    "stops.txt",
+    "routes.txt",
+    "trips.txt",
+    "stop_times.txt",
+    "calendar.txt",
+)
+
+# SQLite copy of the GTFS tables, rebuilt whenever the extracted files change
+GTFS_DATABASE = "gtfs.sqlite"
+
+# Columns indexed in the SQLite copy for the plugin's lookups
+GTFS_INDEXES = {
+    "stops": ("stop_code",),
+    "routes": ("route_short_name",),
+    "trips": ("route_id", "service_id"),
+    "stop_times": ("stop_id", "trip_id"),
+}
+
+# stop_times is by far the largest table, only the columns used are imported
+STOP_TIMES_COLUMNS = ("trip_id", "stop_id", "departure_time", "stop_headsign")
+
+DAY_TRANSLATIONS = {
+    "monday": "poniedziałek",
+    "tuesday": "wtorek",
+    "wednesday": "środa",
+    "thursday": "czwartek",
+    "friday": "piątek",
+    "saturday": "sobota",
+    "sunday": "niedziela",
+}
+
 
 class MpkPoznan(BasePlugin):
     def generate_settings_template(self):
@@ -24,15 +64,21 @@ class MpkPoznan(BasePlugin):
         stop_code = "OJLY02"
         routes = ["151", "185", "190", "193"]
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            data_path = self.fetch_data(temp_dir)
-            feed_info = self.get_feed_info(data_path)
-            stop_info = self.get_stop_info(stop_code, data_path)
-            current_time = self.get_current_time()
-            current_service_id = self.get_service_id(data_path)
+        cache_dir = os.path.join(device_config.cache_dir, self.get_plugin_id())
+        data_path = self.fetch_data(cache_dir)
+        db_path = self.get_database(data_path)
+        if db_path is None:
+            raise RuntimeError("Failed to load GTFS data, please check logs.")
+        current_time = self.get_current_time()
+
+        # Each lookup is a single indexed query, so they share one connection
+        with self._connect(db_path) as conn:
+            feed_info = self.get_feed_info(conn)
+            stop_info = self.get_stop_info(stop_code, conn) or {}
+            current_service_id = self.get_service_id(conn)
             routes_info = {
                 route: self.get_route_info(
-                    route, stop_info["stop_id"], current_service_id, data_path
+                    route, stop_info.get("stop_id"), current_service_id, conn
                 )
                 for route in routes
             }
@@ -56,164 +102,269 @@ class MpkPoznan(BasePlugin):
         )
         return image
 
-    def fetch_data(self, temp_dir):
-        """Download GTFS zip file and extract to temporary location."""
+    def fetch_data(self, cache_dir):
+        """Download GTFS zip file if it changed and extract it to the cache directory.
+
+        The ETag and Last-Modified headers of the last download are stored in
+        etag.json, so an unchanged feed is answered with 304 and the cached
+        extract is reused instead of downloading the whole archive again.
+        """
+        extract_dir = os.path.join(cache_dir, "GTFS")
+        etag_file = os.path.join(cache_dir, "etag.json")
         try:
-            zip_path = os.path.join(temp_dir, "ZTMPoznanGTFS.zip")
+            os.makedirs(cache_dir, exist_ok=True)
 
-            # Download the zip file using curl
-            url = "https://www.ztm.poznan.pl/pl/dla-deweloperow/getGTFSFile"
             headers = {
                 "Accept": "application/octet-stream",
                 "Content-Type": "application/x-www-form-urlencoded",
             }
 
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
+            # Only send validators when there is an extract they refer to
+            cached = {}
+            if os.path.isdir(extract_dir) and os.path.isfile(etag_file):
+                try:
+                    with open(etag_file) as f:
+                        cached = json.load(f)
+                    if not isinstance(cached, dict):
+                        raise ValueError("not a JSON object")
+                except (ValueError, OSError) as e:
+                    # An unreadable etag.json just means the feed is downloaded again
+                    logger.warning(f"Ignoring unreadable {etag_file}: {e}")
+                    cached = {}
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+            with requests.get(
+                GTFS_URL, headers=headers, stream=True, timeout=30
+            ) as response:
+                if response.status_code == 304:
+                    logger.info(f"GTFS data not modified, using cache: {extract_dir}")
+                    return extract_dir
+                response.raise_for_status()
+
+                with tempfile.TemporaryDirectory(dir=cache_dir) as temp_dir:
+                    zip_path = os.path.join(temp_dir, "ZTMPoznanGTFS.zip")
+                    # Stream in 1 MiB chunks so the archive is never held in memory
+                    response.raw.decode_content = True
+                    with open(zip_path, "wb") as f:
+                        shutil.copyfileobj(response.raw, f, length=1 << 20)
 
-            # Write the zip file to disk
-            with open(zip_path, "wb") as f:
-                f.write(response.content)
+                    new_dir = os.path.join(temp_dir, "GTFS")
+                    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                        for name in GTFS_FILES:
+                            try:
+                                zip_ref.extract(name, new_dir)
+                            except KeyError:
+                                logger.warning(f"{name} not found in GTFS archive")
 
-            # Extract the zip file to the temp directory
-            extract_dir = os.path.join(temp_dir, "GTFS")
-            os.makedirs(extract_dir, exist_ok=True)
+                    # Swap the new extract into place, the old one is removed with temp_dir
+                    if os.path.isdir(extract_dir):
+                        os.replace(extract_dir, os.path.join(temp_dir, "GTFS.old"))
+                    os.replace(new_dir, extract_dir)
 
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(extract_dir)
+                # Write to a temporary file first so a power cut can't truncate it
+                tmp_etag_file = f"{etag_file}.tmp"
+                with open(tmp_etag_file, "w") as f:
+                    json.dump(
+                        {
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                        },
+                        f,
+                    )
+                os.replace(tmp_etag_file, etag_file)
 
             logger.info(f"GTFS data downloaded and extracted to: {extract_dir}")
             return extract_dir
 
         except requests.RequestException as e:
             logger.error(f"Error downloading GTFS file: {e}")
-            return None
         except zipfile.BadZipFile as e:
             logger.error(f"Error extracting zip file: {e}")
-            return None
         except Exception as e:
             logger.error(f"Unexpected error in fetch_data: {e}")
-            return None
 
-    def get_feed_info(self, data_path):
+        # Fall back to the previously extracted data if there is any
+        if os.path.isdir(extract_dir):
+            logger.warning(f"Using cached GTFS data: {extract_dir}")
+            return extract_dir
+        return None
+
+    def get_database(self, data_path):
+        """Return the SQLite copy of the GTFS tables, building it if it is out of date.
+
+        Importing the CSV files once per feed turns every later refresh into a few
+        indexed queries instead of parsing the files again.
+        """
         try:
-            feed_info_file = os.path.join(data_path, "feed_info.txt")
-            with open(feed_info_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    return {
-                        "valid_from": datetime.strptime(
-                            row.get("feed_start_date"), "%Y%m%d"
-                        ).strftime("%d-%m-%Y"),
-                        "valid_to": datetime.strptime(
-                            row.get("feed_end_date"), "%Y%m%d"
-                        ).strftime("%d-%m-%Y"),
-                    }
+            db_path = os.path.join(data_path, GTFS_DATABASE)
+            table_files = [
+                os.path.join(data_path, name)
+                for name in GTFS_FILES
+                if os.path.isfile(os.path.join(data_path, name))
+            ]
+            if os.path.isfile(db_path) and os.path.getmtime(db_path) >= max(
+                map(os.path.getmtime, table_files), default=0
+            ):
+                return db_path
+
+            # Build into a temporary file so a partial database is never used
+            tmp_path = f"{db_path}.tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with closing(sqlite3.connect(tmp_path)) as conn:
+                conn.execute("PRAGMA journal_mode = OFF")
+                conn.execute("PRAGMA synchronous = OFF")
+                for table_file in table_files:
+                    table = os.path.splitext(os.path.basename(table_file))[0]
+                    try:
+                        self._import_table(conn, table, table_file)
+                    except Exception as e:
+                        # A broken file only affects the lookups that use its table
+                        logger.error(f"Error importing {table} into GTFS database: {e}")
+                        conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.commit()
+            os.replace(tmp_path, db_path)
+
+            logger.info(f"GTFS database built: {db_path}")
+            return db_path
         except Exception as e:
-            logger.error(f"Error parsing feed_info.txt: {e}")
-            return {}
+            logger.error(f"Error building GTFS database: {e}")
+            return None
+
+    def _import_table(self, conn, table, table_file):
+        """Import a GTFS CSV file into the given table and index it.
+
+        Like csv.DictReader, blank lines are skipped and short rows are padded with
+        empty values. stop_times columns missing from the file are imported empty.
+        """
+        with open(table_file, newline="", encoding="utf-8-sig") as csvfile:
+            reader = csv.reader(csvfile)
+            header = [column.strip() for column in next(reader, [])]
+            if not header:
+                raise ValueError(f"{table_file} has no header")
+
+            indices = list(range(len(header)))
+            if table == "stop_times":
+                indices = [
+                    header.index(column) if column in header else None
+                    for column in STOP_TIMES_COLUMNS
+                ]
+                header = list(STOP_TIMES_COLUMNS)
+            rows = (
+                [row[i] if i is not None and i < len(row) else "" for i in indices]
+                for row in reader
+                if row
+            )
 
-    def get_stop_info(self, stop_code, data_path):
+            columns = ", ".join(f'"{column}"' for column in header)
+            placeholders = ", ".join("?" * len(header))
+            conn.execute(f"CREATE TABLE {table} ({columns})")
+            conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+        if table in GTFS_INDEXES:
+            columns = ", ".join(GTFS_INDEXES[table])
+            conn.execute(f"CREATE INDEX idx_{table} ON {table} ({columns})")
+
+    def _connect(self, db_path):
+        """Open the GTFS database, closing the connection when the with block ends."""
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    def get_feed_info(self, conn):
         try:
-            stops_file = os.path.join(data_path, "stops.txt")
-            with open(stops_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row["stop_code"] == stop_code:
-                        return row
+            row = conn.execute(
+                "SELECT feed_start_date, feed_end_date FROM feed_info LIMIT 1"
+            ).fetchone()
+            # GTFS dates are always YYYYMMDD
+            start, end = row["feed_start_date"], row["feed_end_date"]
+            return {
+                "valid_from": f"{start[6:8]}-{start[4:6]}-{start[0:4]}",
+                "valid_to": f"{end[6:8]}-{end[4:6]}-{end[0:4]}",
+            }
         except Exception as e:
-            logger.error(f"Error parsing stops.txt: {e}")
+            logger.error(f"Error reading feed_info: {e}")
             return {}
 
-    def get_route_info(self, route_name, stop_id, current_service_id, data_path):
-        route_info = {}
+    def get_stop_info(self, stop_code, conn):
         try:
-            routes_file = os.path.join(data_path, "routes.txt")
-            with open(routes_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row["route_short_name"] == route_name:
-                        route_info = row
-                        break
+            row = conn.execute(
+                "SELECT * FROM stops WHERE stop_code = ? LIMIT 1", (stop_code,)
+            ).fetchone()
+            return dict(row) if row else None
         except Exception as e:
-            logger.error(f"Error parsing routes.txt: {e}")
+            logger.error(f"Error reading stops: {e}")
             return {}
-        trips = []
+
+    def get_route_info(self, route_name, stop_id, current_service_id, conn):
         try:
-            trips_file = os.path.join(data_path, "trips.txt")
-            with open(trips_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                trips = [
-                    row
-                    for row in reader
-                    if row["route_id"] == route_info.get("route_id")
-                    and row["service_id"] == current_service_id
-                ]
+            row = conn.execute(
+                "SELECT * FROM routes WHERE route_short_name = ? LIMIT 1",
+                (route_name,),
+            ).fetchone()
+            route_info = dict(row) if row else {}
+            departures = conn.execute(
+                """
+                SELECT st.departure_time, st.stop_headsign
+                FROM trips t
+                JOIN stop_times st ON st.stop_id = ? AND st.trip_id = t.trip_id
+                WHERE t.route_id = ? AND t.service_id = ?
+                ORDER BY st.rowid
+                """,
+                (stop_id, route_info.get("route_id"), current_service_id),
+            ).fetchall()
         except Exception as e:
-            logger.error(f"Error parsing trips.txt: {e}")
+            logger.error(f"Error reading stop_times: {e}")
             return {}
-        try:
-            stop_times_file = os.path.join(data_path, "stop_times.txt")
-            with open(stop_times_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                stop_times_data = [
-                    row
-                    for row in reader
-                    if row["stop_id"] == stop_id
-                    and row["trip_id"] in [trip["trip_id"] for trip in trips]
-                ]
-                route_info["headsign"] = stop_times_data[0]["stop_headsign"]
-                stop_times = [row["departure_time"] for row in stop_times_data]
-                route_info["stop_times"] = self.get_parsed_stop_times(stop_times)
-        except Exception as e:
-            logger.error(f"Error parsing stop_times.txt: {e}")
+        if not departures:
+            logger.warning(f"No departures found for route {route_name} at stop {stop_id}")
             return {}
-        return route_info
 
-    def get_parsed_stop_times(self, stop_times):
         parsed_times = {}
-        for time_str in stop_times:
+        for time_str, _ in departures:
             try:
-                hour, minute, _ = map(int, time_str.split(":"))
+                # GTFS times are HH:MM:SS, some feeds drop the leading zero
+                if time_str[2:3] == ":":
+                    hour, minute = int(time_str[0:2]), int(time_str[3:5])
+                else:
+                    hour, minute = map(int, time_str.split(":")[:2])
                 parsed_times.setdefault(hour, []).append(minute)
             except ValueError:
                 logger.error(f"Invalid time format: {time_str}")
-        for hour in parsed_times:
-            parsed_times[hour].sort()
-        return parsed_times
+        for minutes in parsed_times.values():
+            minutes.sort()
+        route_info["headsign"] = departures[0]["stop_headsign"]
+        route_info["stop_times"] = parsed_times
+        return route_info
 
     def get_current_time(self):
         """Get current time information as a structured object."""
-        now = datetime.now()
-        day_of_week = now.strftime("%A").lower()
+        day_of_week, time, date = (
+            datetime.now().strftime("%A|%H:%M|%d-%m-%Y").split("|")
+        )
+        day_of_week = day_of_week.lower()
         return {
             "day_of_week": day_of_week,
             "day_of_week_translated": self.get_translated_day_of_week(day_of_week),
-            "time": now.strftime("%H:%M"),
-            "date": now.strftime("%d-%m-%Y"),
+            "time": time,
+            "date": date,
         }
 
     def get_translated_day_of_week(self, day_of_week):
-        translations = {
-            "monday": "poniedziałek",
-            "tuesday": "wtorek",
-            "wednesday": "środa",
-            "thursday": "czwartek",
-            "friday": "piątek",
-            "saturday": "sobota",
-            "sunday": "niedziela",
-        }
-        return translations.get(day_of_week.lower(), day_of_week)
+        """Translate a lowercase English day name to Polish."""
+        return DAY_TRANSLATIONS.get(day_of_week, day_of_week)
 
-    def get_service_id(self, data_path):
+    def get_service_id(self, conn):
         current_day = datetime.now().strftime("%A").lower()
         try:
-            calendar_file = os.path.join(data_path, "calendar.txt")
-            with open(calendar_file, newline="", encoding="utf-8-sig") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row[current_day] == "1":
-                        return row["service_id"]
+            row = conn.execute(
+                f'SELECT service_id FROM calendar WHERE "{current_day}" = ? LIMIT 1',
+                ("1",),
+            ).fetchone()
+            return row["service_id"] if row else None
         except Exception as e:
-            logger.error(f"Error parsing calendar.txt: {e}")
+            logger.error(f"Error reading calendar: {e}")
             return {}
@@ -0,0 +1,113 @@
+import threading
+from types import SimpleNamespace
+
+from src.buttons.button_manager import ButtonManager
+
+
+def make_manager(**kwargs):
+    """ButtonManager wired to fake line offsets, without touching GPIO."""
+    manager = ButtonManager(enabled=False, **kwargs)
+    manager.offsets = [10, 11, 12, 13]
+    manager.offset_to_label = dict(zip(manager.offsets, manager.LABELS))
+    manager.offset_to_gpio = dict(zip(manager.offsets, manager.BUTTONS))
+    return manager
+
+
+def press(line_offset, timestamp_ns=0):
+    return SimpleNamespace(line_offset=line_offset, timestamp_ns=timestamp_ns)
+
+
+def queued_labels(manager):
+    labels = []
+    while not manager.event_queue.empty():
+        labels.append(manager.event_queue.get_nowait())
+    return labels
+
+
+class TestDispatch:
+
+    def test_full_queue_drops_oldest(self, monkeypatch):
+        monkeypatch.setattr(ButtonManager, "QUEUE_SIZE", 2)
+        manager = make_manager()
+
+        for offset in (10, 11, 12):
+            manager._handle_button_event(press(offset))
+
+        assert queued_labels(manager) == ["B", "C"]
+
+    def test_unknown_line_is_ignored(self):
+        manager = make_manager()
+        manager._handle_button_event(press(99))
+        assert queued_labels(manager) == []
+
+    def test_handlers_run_on_dispatch_thread(self):
+        manager = make_manager()
+        called = threading.Event()
+        calls = []
+
+        def handler(label):
+            calls.append((label, threading.current_thread()))
+            called.set()
+
+        manager.register_handler("A", handler)
+        manager.stop_event.clear()
+        manager.dispatch_thread = threading.Thread(target=manager._dispatch_loop)
+        manager.dispatch_thread.start()
+        try:
+            manager._handle_button_event(press(10))
+            assert called.wait(timeout=2)
+        finally:
+            manager.stop()
+
+        assert calls == [("A", manager.dispatch_thread)]
+        assert not manager.dispatch_thread.is_alive()
+
+    def test_stop_discards_queued_presses(self):
+        manager = make_manager()
+        manager._handle_button_event(press(10))
+        manager._handle_button_event(press(11))
+
+        manager.stop()
+
+        assert manager.event_queue.empty()
+
+
+MS = 1_000_000
+
+
+def debounced(manager, *events):
+    return [(e.line_offset, e.timestamp_ns) for e in manager._debounce(list(events))]
+
+
+class TestDebounce:
+
+    def test_first_edge_is_kept(self):
+        manager = make_manager(debounce_ms=20)
+        assert debounced(manager, press(10, 5 * MS)) == [(10, 5 * MS)]
+
+    def test_edges_within_window_are_dropped(self):
+        manager = make_manager(debounce_ms=20)
+        events = [press(10, 0), press(10, 5 * MS), press(10, 19 * MS), press(10, 60 * MS)]
+        assert debounced(manager, *events) == [(10, 0), (10, 60 * MS)]
+
+    def test_bounce_train_extends_window(self):
+        manager = make_manager(debounce_ms=20)
+        # Every edge is within 20 ms of the previous one, so only the first counts
+        events = [press(10, t * MS) for t in (0, 15, 30, 45)] + [press(10, 70 * MS)]
+        assert debounced(manager, *events) == [(10, 0), (10, 70 * MS)]
+
+    def test_window_spans_batches(self):
+        manager = make_manager(debounce_ms=20)
+        assert debounced(manager, press(10, 0)) == [(10, 0)]
+        assert debounced(manager, press(10, 10 * MS)) == []
+        assert debounced(manager, press(10, 40 * MS)) == [(10, 40 * MS)]
+
+    def test_lines_are_independent(self):
+        manager = make_manager(debounce_ms=20)
+        events = [press(10, 0), press(11, 1 * MS), press(10, 2 * MS), press(11, 3 * MS)]
+        assert debounced(manager, *events) == [(10, 0), (11, 1 * MS)]
+
+    def test_zero_disables_filter(self):
+        manager = make_manager(debounce_ms=0)
+        events = [press(10, 0), press(10, 0), press(10, 1)]
+        assert debounced(manager, *events) == [(10, 0), (10, 0), (10, 1)]
@@ -0,0 +1,259 @@
+import io
+import json
+import os
+import zipfile
+from contextlib import ExitStack
+
+import pytest
+import requests
+
+from plugins.mpk_poznan.mpk_poznan import GTFS_FILES, MpkPoznan
+
+GTFS = {
+    "feed_info.txt": "feed_publisher_name,feed_start_date,feed_end_date\nZTM,20261001,20261031\n",
+    # Short row without the optional zone_id, an over-long row and trailing blank lines
+    "stops.txt": (
+        "stop_id,stop_code,stop_name,zone_id\n"
+        "1,OJLY02,Os. Jagiellońskie\n"
+        "2,RKAP01,Rondo Kaponiera,A,extra\n"
+        "\n\n"
+    ),
+    "routes.txt": "route_id,route_short_name,route_type\nR1,151,3\nR2,185\n",
+    "trips.txt": "route_id,service_id,trip_id\nR1,S1,T1\nR1,S1,T2\n\nR2,S1,T3\nR1,S2,T4\n",
+    "calendar.txt": (
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday\n"
+        "S1,1,1,1,1,1,1,1\n"
+    ),
+    "stop_times.txt": (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence,stop_headsign\n"
+        "T1,07:12:00,07:12:00,1,1,Rondo\n"
+        "T2,07:01:00,07:01:00,2,1,Rondo\n"
+        "T2,25:05:00,25:05:00,1,2\n"
+        "\n"
+        "T3,08:00:00,08:00:00,1,1,Dworzec\n"
+        "T4,09:00:00,09:00:00,1,1,Rondo\n"
+    ),
+}
+
+
+def write_gtfs(path, files):
+    for name, content in files.items():
+        (path / name).write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def gtfs_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.raw = io.BytesIO(content)
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}")
+
+
+@pytest.fixture
+def plugin():
+    return MpkPoznan({"id": "mpk_poznan"})
+
+
+@pytest.fixture
+def fake_get(monkeypatch):
+    """Queue of responses (or exceptions) returned by requests.get, and the request headers sent."""
+    responses = []
+    sent_headers = []
+
+    def get(url, headers=None, **kwargs):
+        sent_headers.append(headers)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(requests, "get", get)
+    return responses, sent_headers
+
+
+class TestFetchData:
+
+    def download(self, files=GTFS, etag="v1"):
+        headers = {"ETag": etag, "Last-Modified": "Thu, 01 Oct 2026 00:00:00 GMT"}
+        return FakeResponse(200, gtfs_zip(files), headers)
+
+    def test_download_extracts_needed_files(self, plugin, fake_get, tmp_path):
+        responses, sent_headers = fake_get
+        responses.append(self.download({**GTFS, "shapes.txt": "shape_id\n"}))
+
+        data_path = plugin.fetch_data(str(tmp_path))
+
+        assert data_path == str(tmp_path / "GTFS")
+        assert sorted(os.listdir(data_path)) == sorted(GTFS_FILES)
+        assert sorted(os.listdir(tmp_path)) == ["GTFS", "etag.json"]
+        assert json.loads((tmp_path / "etag.json").read_text()) == {
+            "etag": "v1",
+            "last_modified": "Thu, 01 Oct 2026 00:00:00 GMT",
+        }
+        assert "If-None-Match" not in sent_headers[0]
+
+    def test_not_modified_reuses_cache(self, plugin, fake_get, tmp_path):
+        responses, sent_headers = fake_get
+        responses.extend([self.download(), FakeResponse(304)])
+
+        first = plugin.fetch_data(str(tmp_path))
+        second = plugin.fetch_data(str(tmp_path))
+
+        assert second == first
+        assert sorted(os.listdir(second)) == sorted(GTFS_FILES)
+        assert sent_headers[1]["If-None-Match"] == "v1"
+        assert sent_headers[1]["If-Modified-Since"] == "Thu, 01 Oct 2026 00:00:00 GMT"
+
+    def test_changed_feed_replaces_extract(self, plugin, fake_get, tmp_path):
+        responses, _ = fake_get
+        updated = {**GTFS, "feed_info.txt": "feed_start_date,feed_end_date\n20261101,20261130\n"}
+        responses.extend([self.download(), self.download(updated, etag="v2")])
+
+        plugin.fetch_data(str(tmp_path))
+        data_path = plugin.fetch_data(str(tmp_path))
+
+        assert "20261101" in (tmp_path / "GTFS" / "feed_info.txt").read_text()
+        assert json.loads((tmp_path / "etag.json").read_text())["etag"] == "v2"
+        assert sorted(os.listdir(tmp_path)) == ["GTFS", "etag.json"]
+        assert data_path == str(tmp_path / "GTFS")
+
+    def test_failed_download_falls_back_to_cache(self, plugin, fake_get, tmp_path):
+        responses, _ = fake_get
+        responses.extend(
+            [
+                requests.ConnectionError("offline"),
+                self.download(),
+                requests.ConnectionError("offline"),
+                FakeResponse(500),
+            ]
+        )
+
+        assert plugin.fetch_data(str(tmp_path)) is None
+        data_path = plugin.fetch_data(str(tmp_path))
+        assert plugin.fetch_data(str(tmp_path)) == data_path
+        assert plugin.fetch_data(str(tmp_path)) == data_path
+        assert sorted(os.listdir(data_path)) == sorted(GTFS_FILES)
+
+    def test_unreadable_etag_is_ignored(self, plugin, fake_get, tmp_path):
+        responses, sent_headers = fake_get
+        responses.extend([self.download(), self.download(etag="v2")])
+
+        plugin.fetch_data(str(tmp_path))
+        # Truncated by a power cut mid-write
+        (tmp_path / "etag.json").write_text("{")
+        plugin.fetch_data(str(tmp_path))
+
+        assert "If-None-Match" not in sent_headers[1]
+        assert json.loads((tmp_path / "etag.json").read_text())["etag"] == "v2"
+
+
+class TestGtfsDatabase:
+
+    @pytest.fixture
+    def connect(self, plugin, tmp_path):
+        """Build the database from the given GTFS files and open a connection to it."""
+        with ExitStack() as stack:
+
+            def connect(files=GTFS):
+                db_path = plugin.get_database(write_gtfs(tmp_path, files))
+                assert db_path is not None
+                return stack.enter_context(plugin._connect(db_path))
+
+            yield connect
+
+    def test_ragged_rows(self, plugin, connect):
+        conn = connect()
+
+        assert plugin.get_stop_info("OJLY02", conn) == {
+            "stop_id": "1",
+            "stop_code": "OJLY02",
+            "stop_name": "Os. Jagiellońskie",
+            "zone_id": "",
+        }
+        assert plugin.get_stop_info("RKAP01", conn)["zone_id"] == "A"
+        assert plugin.get_feed_info(conn) == {
+            "valid_from": "01-10-2026",
+            "valid_to": "31-10-2026",
+        }
+
+        route_info = plugin.get_route_info("151", "1", "S1", conn)
+        assert route_info["headsign"] == "Rondo"
+        assert route_info["stop_times"] == {7: [12], 25: [5]}
+        assert plugin.get_route_info("185", "1", "S1", conn)["stop_times"] == {8: [0]}
+
+    def test_missing_optional_stop_headsign(self, plugin, connect):
+        files = dict(GTFS)
+        files["stop_times.txt"] = (
+            "trip_id,departure_time,stop_id\n"
+            "T1,07:12:00,1\n"
+            "T2,07:40:00,1\n"
+        )
+        conn = connect(files)
+
+        route_info = plugin.get_route_info("151", "1", "S1", conn)
+        assert route_info["headsign"] == ""
+        assert route_info["stop_times"] == {7: [12, 40]}
+        assert plugin.get_stop_info("OJLY02", conn)["stop_name"] == "Os. Jagiellońskie"
+
+    def test_broken_table_does_not_affect_others(self, plugin, connect):
+        files = dict(GTFS)
+        files["feed_info.txt"] = ""
+        conn = connect(files)
+
+        assert plugin.get_feed_info(conn) == {}
+        assert plugin.get_stop_info("OJLY02", conn)["stop_id"] == "1"
+        assert plugin.get_route_info("151", "1", "S1", conn)["stop_times"]
+
+
+class TestGenerateImage:
+
+    class DeviceConfig:
+        def __init__(self, cache_dir):
+            self.cache_dir = cache_dir
+
+        def get_resolution(self):
+            return (800, 480)
+
+        def get_config(self, key):
+            return "horizontal"
+
+    def test_lookups_share_one_connection(self, plugin, monkeypatch, tmp_path):
+        data_path = write_gtfs(tmp_path, GTFS)
+        monkeypatch.setattr(plugin, "fetch_data", lambda cache_dir: data_path)
+        monkeypatch.setattr(plugin, "render_image", lambda *args: args[-1])
+        connects = []
+        connect = plugin._connect
+        monkeypatch.setattr(
+            plugin, "_connect", lambda db_path: connects.append(db_path) or connect(db_path)
+        )
+
+        params = plugin.generate_image({"title": "MPK"}, self.DeviceConfig(str(tmp_path)))
+
+        assert len(connects) == 1
+        assert params["stop_info"]["stop_code"] == "OJLY02"
+        assert params["routes_info"]["151"]["stop_times"] == {7: [12], 25: [5]}
+        assert params["routes_info"]["190"] == {}
+
+    def test_missing_data_raises(self, plugin, monkeypatch, tmp_path):
+        monkeypatch.setattr(plugin, "fetch_data", lambda cache_dir: None)
+
+        with pytest.raises(RuntimeError):
+            plugin.generate_image({}, self.DeviceConfig(str(tmp_path)))